@@ -8,9 +8,15 @@ import sys
 
 import argparse
 import atexit
+import concurrent.futures
 import datetime
+import functools
+import json
 import logging
+import logging.handlers
 import pathlib
+import shutil
+import signal
 import socket
 import subprocess
 import threading
@@ -18,11 +24,48 @@ import time
 import traceback
 
 import yaml
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 import soundplay
 
 __version__ = '1.32'
 
+# the ssh key and soundplayers are found relative to this file
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# results worth keeping between runs are stored here
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lick_vnc')
+
+# host keys of the Lick servers, kept apart from ~/.ssh/known_hosts
+KNOWN_HOSTS = os.path.join(CACHE_DIR, 'known_hosts')
+
+# log formats, all times are UT
+LOG_FILE_FORMAT = logging.Formatter('%(asctime)s UT - %(levelname)s: %(message)s')
+LOG_FILE_FORMAT.converter = time.gmtime
+LOG_CONSOLE_FORMAT = logging.Formatter(' %(levelname)8s: %(message)s')
+LOG_CONSOLE_FORMAT.converter = time.gmtime
+
+# ssh warnings (e.g. about accepting a host key) mixed into command output
+WARNING_LINE_RE = re.compile(r'^.*Warning: .*(?:\n|$)', re.M)
+
+# xdpyinfo output
+NSCREENS_RE = re.compile(r'number of screens:\s+(\d+)')
+DIMENSIONS_RE = re.compile(r'dimensions:\s+(\d+)x(\d+)')
+
+# version line of the launcher on GitHub
+VERSION_RE = re.compile(r"__version__ = '(\d.+)'")
+
+# default soundplay executable and pv for each platform
+SOUNDPLAYERS = {'darwin' : ('soundplay-107050-8.6.3-macosx10.5-ix86+x86_64', '0.01'),
+                'linux' : ('soundplay-107098-8.6.3-linux-x86_64', None)}
+
+# menu commands that take a number
+CLOSE_CMD_RE = re.compile(r'c (\d+)')
+DESKTOP_CMD_RE = re.compile(r'(\d)')
+
 ##-------------------------------------------------------------------------
 ## Start from command line
 ##-------------------------------------------------------------------------
@@ -39,6 +82,8 @@ def main():
 ##-------------------------------------------------------------------------
 ## Create logger
 ##-------------------------------------------------------------------------
+_logger_initialized = False
+
 def create_logger():
     '''
     create_logger()
@@ -47,41 +92,127 @@ def create_logger():
     Currently this is a global variable, which is then attached to
     the lick_vnc_launcher object.
 
+    Records for the log file are buffered and written out in batches,
+    or at once for warnings and errors.
+
+    Calling it again returns the same logger without adding handlers,
+    which would write every record once more per call.
+
     '''
-    try:
-        ## Create logger object
-        log = logging.getLogger('KRO')
-        log.setLevel(logging.DEBUG)
+    global _logger_initialized
 
-        #create log file and log dir if not exist
-        ymd = datetime.datetime.utcnow().date().strftime('%Y%m%d')
+    ## Create logger object
+    log = logging.getLogger('KRO')
+    if _logger_initialized:
+        return log
+    log.setLevel(logging.DEBUG)
+
+    #create log file and log dir if not exist
+    ymd = datetime.datetime.utcnow().date().strftime('%Y%m%d')
+    logFile = f'logs/lick-remote-log-utc-{ymd}.txt'
+    try:
         pathlib.Path('logs/').mkdir(parents=True, exist_ok=True)
 
         #file handler (full debug logging)
-        logFile = f'logs/lick-remote-log-utc-{ymd}.txt'
         logFileHandler = logging.FileHandler(logFile)
         logFileHandler.setLevel(logging.DEBUG)
-        logFormat = logging.Formatter('%(asctime)s UT - %(levelname)s: %(message)s')
-        logFormat.converter = time.gmtime
-        logFileHandler.setFormatter(logFormat)
-        log.addHandler(logFileHandler)
+        logFileHandler.setFormatter(LOG_FILE_FORMAT)
+        logBuffer = logging.handlers.MemoryHandler(capacity=256,
+                                                   flushLevel=logging.WARNING,
+                                                   target=logFileHandler)
+        log.addHandler(logBuffer)
+        atexit.register(logBuffer.flush)
 
         #stream/console handler (info+ only)
         logConsoleHandler = logging.StreamHandler()
         logConsoleHandler.setLevel(logging.INFO)
-        logFormat = logging.Formatter(' %(levelname)8s: %(message)s')
-        logFormat.converter = time.gmtime
-        logConsoleHandler.setFormatter(logFormat)
+        logConsoleHandler.setFormatter(LOG_CONSOLE_FORMAT)
 
         log.addHandler(logConsoleHandler)
 
-    except Exception as error:
+    except OSError as error:
         print(str(error))
         print(f"ERROR: Unable to create logger at {logFile}")
         print("Make sure you have write access to this directory.\n")
         log.info("Exiting\n")
         sys.exit(1)
 
+    _logger_initialized = True
+    return log
+
+
+##-------------------------------------------------------------------------
+## Host keys for ssh
+##-------------------------------------------------------------------------
+def known_hosts_options():
+    '''
+    known_hosts_options()
+
+    Returns the ssh options that keep the host keys of the Lick servers
+    in KNOWN_HOSTS, unhashed, so ssh looks up a handful of entries
+    instead of the user's whole known_hosts file.
+    '''
+    try:
+        pathlib.Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+    except OSError:
+        # ssh falls back to not recording the key
+        pass
+    # quoted, as ssh splits option values on spaces
+    return [f'-oUserKnownHostsFile="{KNOWN_HOSTS}"', '-oHashKnownHosts=no']
+
+
+##-------------------------------------------------------------------------
+## Find the vncviewer executable
+##-------------------------------------------------------------------------
+@functools.lru_cache(maxsize=None)
+def _locate_vncviewer(vncviewer):
+    '''
+    _locate_vncviewer(vncviewer)
+
+    Returns the full path of the vncviewer executable, which may be
+    given as a name on the PATH or as a path, or None if it does not
+    exist.  The answer is kept for the rest of the run.
+    '''
+    return shutil.which(vncviewer)
+
+
+##-------------------------------------------------------------------------
+## Read and write cached results
+##-------------------------------------------------------------------------
+def read_cache(name):
+    '''
+    read_cache(name)
+
+    Returns the dictionary stored in the JSON file name in CACHE_DIR,
+    or an empty dictionary if there is no usable file.
+    '''
+    try:
+        with open(os.path.join(CACHE_DIR, name)) as FO:
+            return json.load(FO)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_cache(name, data):
+    '''
+    write_cache(name, data)
+
+    Stores the dictionary data as the JSON file name in CACHE_DIR.
+    Failing to write the cache is not an error, it only costs time on
+    the next run.
+    '''
+    try:
+        pathlib.Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+        # replace the file in one step, so that launchers running at the
+        # same time never read a half written cache
+        path = os.path.join(CACHE_DIR, name)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp, 'w') as FO:
+            json.dump(data, FO)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
 
 ##-------------------------------------------------------------------------
 ## Class definitions
@@ -119,9 +250,16 @@ class LickVncLauncher(object):
         self.tel        = None
 
         self.ports_in_use   = {}
+        self.ports_allocated = set()
+        self.ports_lock     = threading.Lock()
         self.vnc_threads    = []
         self.vnc_processes  = []
         self.sessions_found = []
+        self.vncstatus_future = None
+
+        # lookups by session display, kept in step with the above
+        self.sessions_by_display = {}
+        self.port_by_session     = {}
 
         self.vncserver  = None
         self.vncviewer    = None
@@ -140,10 +278,14 @@ class LickVncLauncher(object):
         self.ssh_server         = 'shimmy.ucolick.org'
         self.ssh_additional_kex = '+diffie-hellman-group1-sha1'
 
+        #ssh control masters, keyed by (server, username)
+        self.ssh_masters  = {}
+        self.masters_lock = threading.Lock()
+
         self.exit = False
 
-        self.check_cmd      = None
-        self.check_cmd_args = None
+        # one handle on the null device for all subprocesses
+        self.devnull = open(os.devnull, 'rb+')
 
         self.soundplayer   = None
         self.soundplaytags = ":1,:2,:3,:4,:5,:6"
@@ -160,6 +302,7 @@ class LickVncLauncher(object):
 
         self.geometry = list()
         self.vncviewer_has_geometry = False
+        self.vncviewer_props = None
         self.screens = [[0,0]]
 
         #default start sessions
@@ -205,11 +348,16 @@ class LickVncLauncher(object):
         ## Log basic system info
         ##---------------------------------------------------------------------
         self.log_system_info()
-        self.check_version()
+        # the version check waits on GitHub, so let it run alongside startup
+        version_check = threading.Thread(target=self.check_version, daemon=True)
+        version_check.start()
 
-        self.get_vncviewer_properties()
-        self.get_display_info()
-        self.how_check_local_port()
+        # both probes wait on a local subprocess, run them side by side
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            probes = [executor.submit(self.get_vncviewer_properties),
+                      executor.submit(self.get_display_info)]
+            for probe in probes:
+                probe.result()
 
         if self.args.test:
             self.test_functions()
@@ -224,6 +372,10 @@ class LickVncLauncher(object):
         if not self.tel:
             self.exit_app(f'Invalid telescope account: "{self.args.account}"')
 
+        # ask for the VNC sessions while the connection is validated
+        if not self.args.authonly:
+            self.prefetch_vnc_sessions(self.ssh_account)
+
 
         ##---------------------------------------------------------------------
         ## Validate VPN connection
@@ -246,6 +398,7 @@ class LickVncLauncher(object):
 
         if not self.sessions_found or len(self.sessions_found) == 0:
             self.exit_app('No VNC sessions found')
+        self.sessions_by_display = {s.display: s for s in self.sessions_found}
 
 
         ##---------------------------------------------------------------------
@@ -254,10 +407,24 @@ class LickVncLauncher(object):
         self.calc_window_geometry()
 #         self.ssh_threads  = []
         self.ports_in_use = {}
+        self.port_by_session = {}
         self.vnc_threads  = []
         self.vnc_processes = []
-        for s in self.sessions_found:
-            self.start_vnc_session(s.display)
+        if self.ssh_forward:
+            account = self.ssh_account if self.ssh_key_valid else self.args.account
+            try:
+                self.open_all_ssh_tunnels(self.vncserver, account,
+                                          self.ssh_pkey, self.sessions_found)
+            except Exception:
+                self.log.debug('Could not open all SSH tunnels at once, '
+                               'opening them one at a time')
+                trace = traceback.format_exc()
+                self.log.debug(trace)
+        # each tunnel is independent, so open them all at once
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(self.sessions_found)) as executor:
+            list(executor.map(lambda s: self.start_vnc_session(s.display),
+                              self.sessions_found))
 
 
         ##---------------------------------------------------------------------
@@ -272,6 +439,13 @@ class LickVncLauncher(object):
         ## Wait for quit signal, then all done
         ##---------------------------------------------------------------------
         atexit.register(self.exit_app, msg="App exit")
+        # the viewers run in their own sessions, so closing the terminal
+        # does not reach them; clean up on the way out instead
+        for signame in ('SIGHUP', 'SIGTERM'):
+            signum = getattr(signal, signame, None)
+            if signum is not None:
+                signal.signal(signum, self.handle_signal)
+        version_check.join(timeout=2.0)
         self.prompt_menu()
         self.exit_app()
 
@@ -291,13 +465,8 @@ class LickVncLauncher(object):
         '''
 
 
-#         try:
         #get session data by name
-        session = None
-        for s in self.sessions_found:
-                if s.display == session_display:
-                        session = s
-                        break
+        session = self.sessions_by_display.get(session_display)
 
         if not session:
             self.log.error(f"No server VNC session found for '{session_display}'.")
@@ -319,13 +488,10 @@ class LickVncLauncher(object):
             password = None
 
             # determine if there is already a tunnel for this session
-            local_port = None
-            for p in self.ports_in_use.keys():
-                if session_display == self.ports_in_use[p][1]:
-                    local_port = p
-                    self.log.info(f"Found existing SSH tunnel on port {port}")
-                    vncserver = 'localhost'
-                    break
+            local_port = self.port_by_session.get(session_display)
+            if local_port is not None:
+                self.log.info(f"Found existing SSH tunnel on port {port}")
+                vncserver = 'localhost'
 
             #open ssh tunnel
             if local_port is None:
@@ -358,14 +524,21 @@ class LickVncLauncher(object):
         if self.vncviewer_has_geometry is None:
             self.get_vncviewer_properties()
         if self.vncviewer_has_geometry is True and len(self.geometry) > 0:
-            i = len(self.vnc_threads) % len(self.geometry)
+            # same slot as position_vnc_windows gives it, whichever thread
+            # gets here first
+            i = self.sessions_found.index(session) % len(self.geometry)
             geometry = self.geometry[i]
 
-        ## Open vncviewer as separate thread
-        self.vnc_threads.append(threading.Thread(target=self.launch_vncviewer,
-                                       args=(vncserver, local_port, geometry)))
-        self.vnc_threads[-1].start()
-        time.sleep(0.05)
+        ## Open vncviewer as separate thread, and wait until it has started
+        started = threading.Event()
+        # several sessions are started at once, so never go back to the
+        # list for this thread
+        thread = threading.Thread(target=self.launch_vncviewer,
+                                  args=(vncserver, local_port, geometry,
+                                        started))
+        self.vnc_threads.append(thread)
+        thread.start()
+        started.wait(timeout=0.5)
 
 
 
@@ -400,10 +573,12 @@ class LickVncLauncher(object):
             else:
                 filenames.insert(0, filename)
 
-        #find first file that exists
+        #find first file that exists, reading the directory only once
+        #NOTE: a specified config file has already been checked above
+        entries = {e.name for e in os.scandir('.') if e.is_file()}
         file = None
         for f in filenames:
-            if pathlib.Path(f).is_file():
+            if f in entries or f == filename:
                 file = f
                 break
         if not file:
@@ -413,20 +588,22 @@ class LickVncLauncher(object):
         #load config file and make sure it has the info we need
         self.log.info(f'Using config file:\n {file}')
 
-        # open file a first time just to log the raw contents
+        # read the file once, log the raw contents, then parse them
         with open(file) as FO:
             contents = FO.read()
-#             lines = contents.split('/n')
         self.log.debug(f"Contents of config file: {contents}")
 
-        # open file a second time to properly read config
-        with open(file) as FO:
-            config = yaml.load(FO, Loader=yaml.FullLoader)
+        config = yaml.load(contents, Loader=SafeLoader)
 
         for key in ['vncviewer', 'soundplayer', 'aplay']:
-            if key in config.keys():
-                config[key] = os.path.expanduser(config[key])
-                config[key] = os.path.expandvars(config[key])
+            if key in config:
+                # only expand when needed, expanduser may look up the user
+                v = config[key]
+                if '~' in v:
+                    v = os.path.expanduser(v)
+                if '$' in v:
+                    v = os.path.expandvars(v)
+                config[key] = v
 
 
         cstr = "Parsed Configuration:\n"
@@ -472,8 +649,7 @@ class LickVncLauncher(object):
 
 
         #check ssh_pkeys
-        filepath = os.path.dirname(os.path.abspath(__file__))
-        self.ssh_pkey = os.path.join(filepath,self.ssh_pkey)
+        self.ssh_pkey = os.path.join(MODULE_DIR,self.ssh_pkey)
         if not self.ssh_pkey:
             self.log.warning("No ssh private key file specified in config file.\n")
             sys.exit()
@@ -512,25 +688,18 @@ class LickVncLauncher(object):
 
         Logs basics about the host running the software.
         '''
-        try:
-            self.log.debug(f'System Info: {os.uname()}')
-        except:
-            self.log.debug("os.uname() did not work, hopefully we are on a Windows box")
-            trace = traceback.format_exc()
-            self.log.debug(trace)
+        python_version_str = sys.version.replace("\n", " ")
+        self.log.info(f'Python {python_version_str}')
+        self.log.info(f'Remote Observing Software Version = {__version__}')
 
+        # The hostname is taken from uname, as socket.gethostname() and
+        # especially gethostbyname() can hang on a bad name service.
         try:
-            hostname = socket.gethostname()
-            self.log.debug(f'System hostname: {hostname}')
-            # ip = socket.gethostbyname(hostname)
-            # self.log.debug(f'System IP Address: {ip}')
-            python_version_str = sys.version.replace("\n", " ")
-            self.log.info(f'Python {python_version_str}')
-            self.log.info(f'Remote Observing Software Version = {__version__}')
-        except :
-            self.log.error("Unable to log system info.")
-            trace = traceback.format_exc()
-            self.log.debug(trace)
+            sysinfo = os.uname()
+            self.log.debug(f'System Info: {sysinfo}')
+            self.log.debug(f'System hostname: {sysinfo.nodename}')
+        except AttributeError:
+            self.log.debug("os.uname() did not work, hopefully we are on a Windows box")
 
     ##-------------------------------------------------------------------------
     ## Figure out how to ping
@@ -614,6 +783,10 @@ class LickVncLauncher(object):
     #------------------------------------------------------------------------
     def get_vncviewer_properties(self):
         '''Determine whether we are using TigerVNC
+
+        Running the viewer to find out is slow, so the answer is cached
+        in viewer_props.json keyed on the path and modification time of
+        the viewer, and on this object for the rest of the run.
         '''
         vncviewercmd = self.config.get('vncviewer', 'vncviewer')
         viewonly = self.config.get('vncviewonly',0)
@@ -622,19 +795,34 @@ class LickVncLauncher(object):
         if self.args.viewonly:
             self.vncviewonly = True
 
+        if self.vncviewer_props is None:
+            path = _locate_vncviewer(vncviewercmd)
+            mtime = os.stat(path).st_mtime if path else None
+            cache = read_cache('viewer_props.json')
+            props = cache.get(path) if path else None
+            if props is None or props.get('mtime') != mtime:
+                cmd = [vncviewercmd, '--help']
+                self.log.debug(f'Checking VNC viewer: {" ".join(cmd)}')
+                result = subprocess.run(cmd, capture_output=True)
+                output = result.stdout.decode() + '\n' + result.stderr.decode()
+                props = {'mtime' : mtime,
+                         'tigervnc' : 'TigerVNC' in output,
+                         'geometry' : 'geometry' in output or 'Geometry' in output}
+                if path:
+                    cache[path] = props
+                    write_cache('viewer_props.json', cache)
+            else:
+                self.log.debug(f'Using cached properties for VNC viewer {path}')
+            self.vncviewer_props = props
 
-        cmd = [vncviewercmd, '--help']
-        self.log.debug(f'Checking VNC viewer: {" ".join(cmd)}')
-        result = subprocess.run(cmd, capture_output=True)
-        output = result.stdout.decode() + '\n' + result.stderr.decode()
-        if re.search(r'TigerVNC', output):
+        if self.vncviewer_props['tigervnc']:
             self.log.info(f'We ARE using TigerVNC')
             self.tigervnc = True
         else:
             self.log.debug(f'We ARE NOT using TigerVNC')
             self.tigervnc = False
 
-        if re.search(r'[Gg]eometry', output):
+        if self.vncviewer_props['geometry']:
             self.log.info(f'Found geometry argument')
             self.vncviewer_has_geometry = True
         else:
@@ -673,9 +861,8 @@ class LickVncLauncher(object):
         else:
             print(f"\nSSH tunnels:")
             print(f"  Local Port | Desktop   | Remote Connection")
-            for p in self.ports_in_use.keys():
-                desktop = self.ports_in_use[p][1]
-                remote_connection = self.ports_in_use[p][0]
+            for p, entry in self.ports_in_use.items():
+                remote_connection, desktop = entry[0], entry[1]
                 print(f"  {p:10d} | {desktop:9s} | {remote_connection:s}")
 
 
@@ -704,23 +891,24 @@ class LickVncLauncher(object):
         session_name - the name of the session at the remote observing host
 
         '''
+        # reuse the tunnel already open for this session, if it still works
+        with self.ports_lock:
+            existing = self.port_by_session.get(session_name)
+        if existing is not None and session_name != 'unknown':
+            if self.is_local_port_in_use(existing):
+                self.log.info(f"Found existing SSH tunnel for {session_name} "
+                              f"on port {existing}")
+                return existing
+            self.close_ssh_thread(existing)
+
         #get next local port if need be
-        #NOTE: Try up to 100 ports beyond
         if not local_port:
-            for i in range(0,100):
-                if self.is_local_port_in_use(self.local_port):
-                    self.local_port += 1
-                    continue
-                else:
-                    local_port = self.local_port
-                    self.local_port += 1
-                    break
+            local_port = self.next_local_port()
 
         #if we can't find an open port, error and return
         if not local_port:
             self.log.error(f"Could not find an open local port for SSH tunnel "
                            f"to {username}@{server}:{remote_port}")
-            self.local_port = self.LOCAL_PORT_START
             return False
 
         #log
@@ -728,85 +916,366 @@ class LickVncLauncher(object):
         self.log.info(f"Opening SSH tunnel for {address_and_port} "
                  f"on local port {local_port}.")
 
-        # build the command
         forwarding = f"{local_port}:localhost:{remote_port}"
-        command = ['ssh', '-l', username, '-L', forwarding, '-N', '-T', server]
-        command.append('-oStrictHostKeyChecking=no')
-        command.append('-oCompression=yes')
-        if self.ssh_additional_kex is not None:
-            command.append('-oKexAlgorithms=' + self.ssh_additional_kex)
+        null = self.devnull
+        proc = None
+        cancel = None
+
+        # First try to add the forward to a shared control master, which
+        # needs no new authentication.
+        control_path = self.open_ssh_master(server, username, ssh_pkey)
+        if control_path is not None:
+            command = ['ssh', '-S', control_path, '-O', 'forward',
+                       '-L', forwarding, server]
+            self.log.debug('ssh command: ' + ' '.join (command))
+            result = self.ssh_control(command)
+            if result is not None and result.returncode == 0:
+                cancel = ['ssh', '-S', control_path, '-O', 'cancel',
+                          '-L', forwarding, server]
+            else:
+                self.log.debug(f'Forwarding through {control_path} failed, '
+                               f'opening a separate ssh tunnel')
 
-        if ssh_pkey is not None:
-            command.append('-i')
-            command.append(ssh_pkey)
+        if cancel is None:
+            # build the command
+            command = ['ssh', '-l', username, '-L', forwarding, '-N', '-T', server]
+            command += self.ssh_options(ssh_pkey)
+
+            self.log.debug('ssh command: ' + ' '.join (command))
+            proc = subprocess.Popen(command,stdin=null,stdout=null,stderr=null)
 
+
+            # Having started the process let's make sure it's actually running.
+            # First try polling,  then confirm the requested local port is in use.
+            # It's a fatal error if either check fails.
+
+            if proc.poll() is not None:
+                raise RuntimeError('subprocess failed to execute ssh')
+
+        self.wait_for_local_port(local_port, proc)
+
+        in_use = [address_and_port, session_name, proc, cancel]
+        with self.ports_lock:
+            self.ports_in_use[local_port] = in_use
+            self.port_by_session[session_name] = local_port
+
+        return local_port
+
+
+    ##-------------------------------------------------------------------------
+    ## Open ssh tunnels for several sessions at once
+    ##-------------------------------------------------------------------------
+    def open_all_ssh_tunnels(self, server, username, ssh_pkey, sessions):
+        '''
+        open_all_ssh_tunnels(self, server, username, ssh_pkey, sessions)
+
+        server - host to make connection to
+        username - username for account to ssh to, always an observing account
+        ssh_pkey - the public key for the username on server
+        sessions - the VNCSession objects to open tunnels for
+
+        Opens the tunnels for all sessions that do not have one yet through
+        the ssh control master, with a single -O forward carrying one -L
+        option per session.  Without a master nothing is opened, since
+        tunnels sharing one ssh process could not be closed one at a time;
+        open_ssh_tunnel() gives each session its own process instead.
+        Raises an exception if the tunnels do not come up.
+
+        '''
+        forwards = []
+        with self.ports_lock:
+            sessions = [s for s in sessions
+                        if s.display not in self.port_by_session]
+        if len(sessions) == 0:
+            return
+        control_path = self.open_ssh_master(server, username, ssh_pkey)
+        if control_path is None:
+            return
+        for s in sessions:
+            local_port = self.next_local_port()
+            if not local_port:
+                raise RuntimeError('Could not find enough open local ports')
+            remote_port = int(f"59{int(s.display):02d}")
+            forwards.append((local_port, remote_port, s.display))
+
+        options = []
+        for local_port, remote_port, display in forwards:
+            options += ['-L', f"{local_port}:localhost:{remote_port}"]
+            self.log.info(f"Opening SSH tunnel for {username}@{server}:{remote_port} "
+                          f"on local port {local_port}.")
+
+        command = ['ssh', '-S', control_path, '-O', 'forward'] + options
+        command.append(server)
         self.log.debug('ssh command: ' + ' '.join (command))
-        null = subprocess.DEVNULL
-        proc = subprocess.Popen(command,stdin=null,stdout=null,stderr=null)
+        result = self.ssh_control(command)
+        if result is None or result.returncode != 0:
+            raise RuntimeError(f'Forwarding through {control_path} failed')
+
+        cancels = {}
+        for local_port, remote_port, display in forwards:
+            cancels[local_port] = ['ssh', '-S', control_path, '-O', 'cancel', '-L',
+                                   f"{local_port}:localhost:{remote_port}", server]
+        try:
+            for local_port, remote_port, display in forwards:
+                self.wait_for_local_port(local_port)
+        except RuntimeError:
+            for cancel in cancels.values():
+                self.ssh_control(cancel)
+            raise
+
+        with self.ports_lock:
+            for local_port, remote_port, display in forwards:
+                in_use = [f"{username}@{server}:{remote_port}", display,
+                          None, cancels[local_port]]
+                self.ports_in_use[local_port] = in_use
+                self.port_by_session[display] = local_port
+
 
+    ##-------------------------------------------------------------------------
+    ## Find a local port for a tunnel
+    ##-------------------------------------------------------------------------
+    def next_local_port(self):
+        '''
+        next_local_port(self)
 
-        # Having started the process let's make sure it's actually running.
-        # First try polling,  then confirm the requested local port is in use.
-        # It's a fatal error if either check fails.
+        Returns a local port that is not in use and is not below
+        self.local_port, or None if no such port was found.
 
-        if proc.poll() is not None:
-            raise RuntimeError('subprocess failed to execute ssh')
+        The kernel hands out a free port when binding to port 0, which
+        saves probing ports one at a time.  The port is released again
+        right away for ssh to bind.
 
-        checks = 50
-        while checks > 0:
-            result = self.is_local_port_in_use(local_port)
-            if result == True:
-                break
+        '''
+        #NOTE: tunnels may be opened from several threads at once
+        with self.ports_lock:
+            for i in range(0,5):
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                    s.bind(('127.0.0.1', 0))
+                    local_port = s.getsockname()[1]
+                if local_port < self.local_port or local_port in self.ports_allocated:
+                    continue
+                self.ports_allocated.add(local_port)
+                return local_port
+
+            # the kernel kept picking ports below the floor, so look
+            # upwards from it instead
+            local_port = self.find_free_local_port(self.local_port)
+            if local_port is not None:
+                self.ports_allocated.add(local_port)
+            return local_port
+
+
+    def find_free_local_port(self, start, count=50):
+        '''
+        find_free_local_port(self, start, count=50)
+
+        start - first port to consider
+        count - number of ports to consider
+
+        Probes the ports start to start+count-1 concurrently and returns
+        the first one found free and not already handed out, or None.
+
+        '''
+        ports = [p for p in range(start, min(start+count, 65536))
+                 if p not in self.ports_allocated]
+        if len(ports) == 0:
+            return None
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(20, len(ports))) as executor:
+            futures = {executor.submit(self.is_local_port_in_use, p): p
+                       for p in ports}
+            for future in concurrent.futures.as_completed(futures):
+                if future.result() is False:
+                    for other in futures:
+                        other.cancel()
+                    return futures[future]
+        return None
+
+
+    ##-------------------------------------------------------------------------
+    ## Wait for a tunnel to come up
+    ##-------------------------------------------------------------------------
+    def wait_for_local_port(self, local_port, proc=None):
+        '''
+        wait_for_local_port(self, local_port, proc=None)
+
+        local_port - the port the tunnel listens on
+        proc - optional ssh process providing the tunnel
+
+        Waits until something listens on local_port, raises RuntimeError
+        if that takes more than 5 seconds, or as soon as proc exits.
+
+        '''
+        # Most tunnels are up within a few tens of milliseconds, so start
+        # with a short wait and back off exponentially up to 5 seconds total.
+        delay = 0.005
+        waited = 0
+        while not self.is_local_port_in_use(local_port):
+            if waited >= 5:
+                raise RuntimeError('ssh tunnel failed to open after 5 seconds')
+            if proc is None:
+                time.sleep(delay)
             else:
-                checks -= 1
-                time.sleep(0.1)
+                # sleeps the same, but wakes up if ssh gives up
+                try:
+                    returncode = proc.wait(timeout=delay)
+                except subprocess.TimeoutExpired:
+                    pass
+                else:
+                    raise RuntimeError(f'ssh exited with code {returncode} '
+                                       f'before the tunnel opened')
+            waited += delay
+            delay = min(delay*2, 0.5)
 
-        if checks == 0:
-            raise RuntimeError('ssh tunnel failed to open after 5 seconds')
 
-        in_use = [address_and_port, session_name, proc]
-        self.ports_in_use[local_port] = in_use
+    ##-------------------------------------------------------------------------
+    ## Options shared by the ssh commands that open tunnels
+    ##-------------------------------------------------------------------------
+    def ssh_options(self, ssh_pkey):
+        '''
+        ssh_options(self, ssh_pkey)
 
-        return local_port
+        ssh_pkey - the private key to authenticate with, may be None
+
+        Returns the list of ssh options used when opening tunnels.
+        '''
+        options = ['-oStrictHostKeyChecking=no', '-oCompression=yes']
+        options += known_hosts_options()
+        if self.ssh_additional_kex is not None:
+            options.append('-oKexAlgorithms=' + self.ssh_additional_kex)
+
+        if ssh_pkey is not None:
+            options.append('-i')
+            options.append(ssh_pkey)
+
+        return options
 
 
     ##-------------------------------------------------------------------------
+    ## Open ssh control master
     ##-------------------------------------------------------------------------
-    def how_check_local_port(self):
+    def open_ssh_master(self, server, username, ssh_pkey):
         '''
-        how_check_local_port(self)
+        open_ssh_master(self, server, username, ssh_pkey)
+
+        Starts one authenticated ssh connection to username@server that
+        later tunnels are multiplexed over, so each new tunnel is added in
+        milliseconds instead of doing its own key exchange.
+
+        The control socket lives in CACHE_DIR and the master outlives this
+        program, so the next launch during the night reuses it and skips
+        authentication entirely.  Keepalives make a master whose
+        connection died exit within a minute or so; do_ssh_cmd drops one
+        that fails before then.
 
-        This examines the output of various commands on the observers local
-        host.
-        The purpose is to find the correct command to find open ports.
-        Prefers in order ss,lsof, netstat.exe (Windows System for Linux)
-        and then ps.  ps does not always work the way one would like as
-        a process may not have an actual open port even if it claims the
-        port was open.
+        Returns the path to the control socket, or None if no master
+        could be started.  Callers should then open a separate tunnel.
         '''
+        with self.masters_lock:
+            key = (server, username)
+            if key in self.ssh_masters:
+                return self.ssh_masters[key]
 
-        self.check_cmd = self.config.get('check_cmd', None)
+            control_path = os.path.join(CACHE_DIR, f'cm-{username}@{server}')
+            pid = self.check_ssh_master(control_path, server)
+            if pid is not None:
+                self.log.debug(f'Reusing ssh master for {username}@{server} '
+                               f'(pid {pid})')
+            else:
+                # a socket left by a master that died would stop ssh from
+                # becoming the new master
+                if os.path.exists(control_path):
+                    os.remove(control_path)
+                pathlib.Path(CACHE_DIR).mkdir(parents=True, exist_ok=True)
+                # started from a background thread, so it must never wait
+                # on a prompt or a dead route, and it must notice when the
+                # connection behind it is gone
+                command = ['ssh', '-l', username, '-M', '-S', control_path,
+                           '-oControlPersist=12h', '-oBatchMode=yes',
+                           '-oConnectTimeout=5', '-oServerAliveInterval=15',
+                           '-oServerAliveCountMax=3', '-N', '-T', server]
+                command += self.ssh_options(ssh_pkey)
+                self.log.debug('ssh master command: ' + ' '.join (command))
+
+                # With ControlPersist set ssh moves to the background once
+                # it has authenticated, so this returns when it is ready.
+                null = self.devnull
+                try:
+                    result = subprocess.run(command, stdin=null, stdout=null,
+                                            stderr=null, timeout=10)
+                except subprocess.TimeoutExpired:
+                    result = None
+                if result is not None and result.returncode == 0:
+                    pid = self.check_ssh_master(control_path, server)
+                if pid is None:
+                    # remember the failure so later tunnels go straight
+                    # to their own ssh process
+                    self.log.debug(f'Failed to start ssh master for '
+                                   f'{username}@{server}')
+                    self.ssh_masters[key] = None
+                    return None
 
-        if self.check_cmd is None:
-            self.check_cmd = self.args.check
+            self.ssh_masters[key] = control_path
+            return control_path
 
-        if self.check_cmd in ("ps","ss","lsof","netstat.exe"):
-            try:
-                cmd = subprocess.check_output(['which', self.check_cmd])
-                return
-            except:
-                self.log.debug(f"{self.args.check} is not found")
 
-        for tst_cmd in ("ss","lsof","netstat.exe","ps"):
-            try:
-                cmd = subprocess.check_output(['which', tst_cmd])
-                self.check_cmd = tst_cmd
-                return
-            except subprocess.CalledProcessError:
-                self.log.debug(f"{tst_cmd} is not found")
+    ##-------------------------------------------------------------------------
+    ## Check for a running ssh control master
+    ##-------------------------------------------------------------------------
+    def check_ssh_master(self, control_path, server):
+        '''
+        check_ssh_master(self, control_path, server)
 
+        control_path - path to the control socket of the master
+        server - host the master is connected to
+
+        Returns the pid of the master listening on control_path, 0 if it
+        is running but did not report a pid, or None if it is not running.
+        '''
+        if not os.path.exists(control_path):
+            return None
+        command = ['ssh', '-S', control_path, '-O', 'check', server]
+        result = self.ssh_control(command)
+        if result is None or result.returncode != 0:
+            return None
+        findpid = re.search(r'pid=(\d+)', result.stderr.decode())
+        return int(findpid.group(1)) if findpid is not None else 0
+
+
+    def ssh_control(self, command):
+        '''
+        ssh_control(self, command)
+
+        command - an 'ssh -S <socket> -O ...' command
+
+        Runs a control command against an ssh master.  Returns the
+        CompletedProcess, with stdout and stderr captured, or None if
+        the master did not answer within 10 seconds.
+        '''
+        try:
+            return subprocess.run(command, stdin=self.devnull,
+                                  capture_output=True, timeout=10)
+        except subprocess.TimeoutExpired:
+            self.log.debug('ssh control command timed out: ' + ' '.join(command))
+            return None
+
+
+    def drop_ssh_master(self, server, username):
+        '''
+        drop_ssh_master(self, server, username)
+
+        Tells the master for username@server to exit and forgets it, so
+        the next open_ssh_master() starts a fresh one.  Used when a
+        command over the master fails: a master reused from an earlier
+        run still answers locally after its connection has died.
+        '''
+        with self.masters_lock:
+            control_path = self.ssh_masters.pop((server, username), None)
+        if control_path is None:
+            return
+        self.log.debug(f'Dropping ssh master {control_path}')
+        self.ssh_control(['ssh', '-S', control_path, '-O', 'exit', server])
 
-        return
 
     ##-------------------------------------------------------------------------
     ##-------------------------------------------------------------------------
@@ -816,29 +1285,24 @@ class LickVncLauncher(object):
 
         port - the port number of interest
 
-        Checks if port is in use or open. Uses the method
-        determined by how_check_local_port()
-
-        '''
-        if self.check_cmd == 'netstat.exe':
-            cmd = f'netstat.exe -an | grep ":{port}"'
-        elif self.check_cmd == 'ss':
-            cmd = f'ss -l | grep ":{port}"'
-        elif self.check_cmd == 'lsof':
-            cmd = f'lsof -i -P -n | grep LISTEN | grep ":{port} (LISTEN)" | grep -v grep'
-        elif self.check_cmd == 'ps':
-            cmd = f'ps aux | grep "{port}:" | grep -v grep'
-
-        self.log.debug(f'Checking for port {port} in use: {cmd}')
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        data = proc.communicate()[0]
-        data = data.decode("utf-8").strip()
-        lines = data.split('\n') if data else list()
-        if lines:
-            self.log.debug(f"Port {port} is in use.")
-            return True
-        else:
+        Checks if port is in use or open by connecting to it on the
+        loopback interface.  A refused connection means nothing listens
+        there, so the port is free.
+
+        '''
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.05):
+                pass
+        except ConnectionRefusedError:
+            return False
+        except socket.timeout:
+            # a listener that is too busy to accept still owns the port
+            pass
+        except OSError as e:
+            self.log.debug(f'Socket check of port {port} failed: {e}')
             return False
+        self.log.debug(f"Port {port} is in use.")
+        return True
 
     ##-------------------------------------------------------------------------
     ## Guess which vncviewerCmd to use if not specified
@@ -873,12 +1337,14 @@ class LickVncLauncher(object):
     ##-------------------------------------------------------------------------
     ## Launch vncviewer
     ##-------------------------------------------------------------------------
-    def launch_vncviewer(self, vncserver, port, geometry=None):
+    def launch_vncviewer(self, vncserver, port, geometry=None, started=None):
         '''
-        launch_vncviewer(self, vncserver, port, geometry=None)
+        launch_vncviewer(self, vncserver, port, geometry=None, started=None)
 
         vncserver - remote host to connect to and open the VNC session
         port - remote port to connect for VNC session
+        started - optional threading.Event, set once the viewer process
+            has been launched (or failed to launch)
 
 
         '''
@@ -905,11 +1371,18 @@ class LickVncLauncher(object):
             cmd.append(f'{vncprefix}{vncserver}::{port:4d}')
 
         self.log.debug(f"VNC viewer command: {cmd}")
-        null = subprocess.DEVNULL
-        proc = subprocess.Popen(cmd,stdin=null,stdout=null,stderr=null)
+        null = self.devnull
+        try:
+            # own process group, so the viewer and anything it spawns can
+            # be signalled together on exit
+            proc = subprocess.Popen(cmd,stdin=null,stdout=null,stderr=null,
+                                    start_new_session=True)
 
-        #append to proc list so we can terminate on app exit
-        self.vnc_processes.append(proc)
+            #append to proc list so we can terminate on app exit
+            self.vnc_processes.append(proc)
+        finally:
+            if started is not None:
+                started.set()
 
 
     ##-------------------------------------------------------------------------
@@ -981,9 +1454,18 @@ class LickVncLauncher(object):
         command = [soundplayer, '-l']
 
         self.log.info('Calling: ' + ' '.join (command))
-        test_sound_STDOUT = subprocess.check_output(command)
-        for line in test_sound_STDOUT.decode().split('\n'):
-            self.log.debug(f'  {line}')
+        with subprocess.Popen(command, stdin=self.devnull, stdout=subprocess.PIPE,
+                              text=True, bufsize=1) as proc:
+            # a hung soundplay must not stall the menu
+            killer = threading.Timer(10, proc.kill)
+            killer.start()
+            try:
+                for line in proc.stdout:
+                    self.log.debug(f'  {line.rstrip()}')
+            finally:
+                killer.cancel()
+        if proc.returncode != 0:
+            self.log.error(f'  {soundplayer} failed with error {proc.returncode}')
 
     ##-------------------------------------------------------------------------
     ## Guess which soundplay to use if not specified
@@ -995,16 +1477,10 @@ class LickVncLauncher(object):
 
         Guesses the sound play executable to use if it is not specified.
         '''
-        try:
-            sysinfo = os.uname()
-            if sysinfo.sysname == 'Darwin':
-                self.soundplayer = 'soundplay-107050-8.6.3-macosx10.5-ix86+x86_64'
-                self.pv = '0.01'
-            elif sysinfo.sysname == 'Linux':
-                self.soundplayer = 'soundplay-107098-8.6.3-linux-x86_64'
-
-        except:
-            return
+        entry = SOUNDPLAYERS.get(sys.platform)
+        if entry is not None:
+            self.soundplayer = entry[0]
+            self.pv = entry[1] or self.pv
 
 
 
@@ -1038,20 +1514,31 @@ class LickVncLauncher(object):
     ##-------------------------------------------------------------------------
     ## Utility function for opening ssh client, executing command and closing
     ##-------------------------------------------------------------------------
-    def do_ssh_cmd(self, cmd, server, account, timeout=10):
+    def do_ssh_cmd(self, cmd, server, account, timeout=10, use_master=True):
         '''
-        do_ssh_cmd(self, cmd, server, account, timeout=10)
+        do_ssh_cmd(self, cmd, server, account, timeout=10, use_master=True)
 
         cmd - command to execute on remote host
         server  - remote host to ssh to
         account - the account to use on the remote host
         timeout - amount of time in seconds to wait
+        use_master - run over the ssh control master, if there is one
 
 
         '''
         output = None
         self.log.debug(f'Trying SSH connect to {server} as {account}:')
-        command = ['ssh', server, '-l', account, '-T', '-x']
+        # never wait on a prompt or a dead network, fail instead
+        command = ['ssh', server, '-l', account, '-T', '-x',
+                   '-oBatchMode=yes', '-oConnectTimeout=5',
+                   '-oStrictHostKeyChecking=accept-new']
+        command += known_hosts_options()
+
+        # run over the control master if there is one, saving the handshake
+        control_path = self.ssh_masters.get((server, account)) if use_master else None
+        if control_path is not None:
+            command += ['-o', f'ControlPath="{control_path}"',
+                        '-o', 'ControlMaster=no']
 
         if self.ssh_pkey is not None:
             command.append('-i')
@@ -1060,24 +1547,29 @@ class LickVncLauncher(object):
         command.append(cmd)
         self.log.debug('ssh command: ' + ' '.join (command))
 
-        pipe = subprocess.PIPE
-        null = subprocess.DEVNULL
-        stdout = subprocess.STDOUT
-        stdin = null
-
-        proc = subprocess.Popen(command, stdin=stdin, stdout=pipe, stderr=stdout)
-        if proc.poll() is not None:
-            raise RuntimeError('subprocess failed to execute ssh')
-
         try:
-            stdout,stderr = proc.communicate(timeout=timeout)
+            proc = subprocess.run(command, stdin=self.devnull,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT,
+                                  timeout=timeout, check=False)
         except subprocess.TimeoutExpired:
-            proc.kill()
-            stdout,stderr = proc.communicate(timeout=timeout)
+            proc = None
+
+        # ssh itself fails with 255; over a master that usually means the
+        # master's connection is gone, so retry once on a connection of
+        # our own
+        if control_path is not None and (proc is None or proc.returncode == 255):
+            self.log.debug(f'Command over ssh master {control_path} failed, '
+                           f'retrying without it')
+            self.drop_ssh_master(server, account)
+            return self.do_ssh_cmd(cmd, server, account, timeout=timeout,
+                                   use_master=False)
+
+        if proc is None:
             self.log.error('  Timeout')
             return None
 
-        stdout = stdout.decode()
+        stdout = proc.stdout.decode()
         stdout = stdout.strip()
         self.log.debug(f"Output: '{stdout}'")
         
@@ -1085,24 +1577,17 @@ class LickVncLauncher(object):
             message = '  command failed with error ' + str(proc.returncode)
             self.log.error(message)
             if 'Host key verification failed' in stdout:
-                message = f'The entry into .ssh/known_hosts for {server} is old and needs to be removed, edit that file and try to ssh by hand.' 
+                message = f'The entry into {KNOWN_HOSTS} for {server} is old and needs to be removed, edit that file and try again.' 
                 self.log.error(message)
             return None
 
         # The first line might be a warning about accepting a ssh host key.
         # Check for that, and get rid of it from the output.
 
-        lines = stdout.split('\n')
-
-        output = []
-
-        for ln in lines:
-            if 'Warning: ' in ln:
-                self.log.debug('Removed warning from command output:')
-                self.log.debug(ln)
-            else:
-                output.append(ln)
-        stdout = '\n'.join(output)
+        stdout, nwarnings = WARNING_LINE_RE.subn('', stdout)
+        stdout = stdout.rstrip('\n')
+        if nwarnings > 0:
+            self.log.debug(f'Removed {nwarnings} warning(s) from command output')
 
         return stdout
     ##-------------------------------------------------------------------------
@@ -1138,17 +1623,13 @@ class LickVncLauncher(object):
 
         # note fix 
         cmds = ['/usr/sbin/netstat','/sbin/ip']
-        correct_cmd = None
-        for cmd in cmds:
-            if correct_cmd is None:
-                try:
-                    data = subprocess.check_output(['which', cmd])
-                    self.log.info(f'  Command {cmd} found')
-                except Exception as e:
-                    self.log.debug('  Failed to find command ' +str(cmd) + ' ' + str(e))
-                    data = None
-                if data:
-                    correct_cmd = cmd
+
+        # the first one in the list wins
+        correct_cmd = next((cmd for cmd in cmds if shutil.which(cmd)), None)
+        if correct_cmd:
+            self.log.info(f'  Command {correct_cmd} found')
+        else:
+            self.log.debug('  Failed to find any of ' + ', '.join(cmds))
 
         flags = ''
         if correct_cmd == '/usr/sbin/netstat':
@@ -1156,14 +1637,17 @@ class LickVncLauncher(object):
         if correct_cmd == '/sbin/ip':
             flags = 'route'
         if correct_cmd:
-            cmd = f"{correct_cmd} {flags} | grep 128.114"
-            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            data = proc.communicate()[0]
-            data = data.decode("utf-8").strip()
-            lines = data.split('\n') if data else list()
-            if len(lines) > 0:
-                self.connection_valid = True
-
+            cmd = [correct_cmd, *flags.split()]
+            try:
+                res = subprocess.run(cmd, capture_output=True, text=True,
+                                     timeout=5)
+            except subprocess.TimeoutExpired:
+                self.log.debug(f'  {correct_cmd} timed out')
+                res = None
+            if res is not None:
+                lines = [ln for ln in res.stdout.splitlines() if '128.114' in ln]
+                if len(lines) > 0:
+                    self.connection_valid = True
 
         if self.connection_valid:
             self.log.info(" Connection  OK")
@@ -1182,12 +1666,15 @@ class LickVncLauncher(object):
         '''
         # find file
         rv = False
-        cpath = os.path.dirname(os.path.abspath(__file__))
-        fullpath = os.path.join(cpath,self.ssh_pkey)
-        if not os.path.exists:
+        fullpath = os.path.join(MODULE_DIR,self.ssh_pkey)
+        try:
+            mode = os.stat(fullpath).st_mode
+        except OSError:
             self.log.error(f"RSA key {fullpath} does not exist")
             return rv
-        # check mode
+        # check mode, usually it is already right
+        if stat.S_IMODE(mode) == stat.S_IRUSR:
+            return True
         # set mode to 400
         try:
             os.chmod(fullpath,stat.S_IRUSR)
@@ -1197,6 +1684,51 @@ class LickVncLauncher(object):
 
         return rv
 
+    ##-------------------------------------------------------------------------
+    ## Run vncstatus on the vncserver
+    ##-------------------------------------------------------------------------
+    def query_vncstatus(self, account):
+        '''
+        query_vncstatus(self, account)
+
+        account - account on vncserver running the VNC sessions
+
+        Runs the remote task vncstatus and returns its output, or None
+        if the command failed.
+
+        '''
+        vncserver = self.servers_to_try[self.tel]
+        # ssh refuses a key that others can read
+        self.change_mod()
+        # the tunnels will use the same connection later
+        self.open_ssh_master(vncserver, account, self.ssh_pkey)
+        return self.do_ssh_cmd('vncstatus', vncserver, account)
+
+
+    def prefetch_vnc_sessions(self, account):
+        '''
+        prefetch_vnc_sessions(self, account)
+
+        account - account on vncserver running the VNC sessions
+
+        Starts query_vncstatus() in the background so the remote round
+        trip overlaps with the local checks.  get_vnc_sessions() picks up
+        the result.  The thread is a daemon, so exiting early does not
+        wait for it.
+
+        '''
+        future = concurrent.futures.Future()
+
+        def query():
+            try:
+                future.set_result(self.query_vncstatus(account))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.vncstatus_future = future
+        threading.Thread(target=query, daemon=True).start()
+
+
     ##-------------------------------------------------------------------------
     ## Determine VNC Sessions
     ##-------------------------------------------------------------------------
@@ -1219,9 +1751,12 @@ class LickVncLauncher(object):
         self.log.info(f"Connecting to {account}@{vncserver} to get VNC sessions list")
 
         sessions = []
-        cmd = f"vncstatus"
         try:
-            data = self.do_ssh_cmd(cmd, vncserver, account)
+            if self.vncstatus_future is not None:
+                data = self.vncstatus_future.result()
+                self.vncstatus_future = None
+            else:
+                data = self.query_vncstatus(account)
         except Exception as e:
             self.log.error('  Failed: ' + str(e))
             trace = traceback.format_exc()
@@ -1232,9 +1767,8 @@ class LickVncLauncher(object):
             self.exit_app('Failed at obtaining list of VNC sessions, see log.')
 
         self.ssh_key_valid = True
-        lns = data.split("\n")
-        for ln in lns:
-            if ln[0] == "#":
+        for ln in data.splitlines():
+            if not ln or ln.startswith("#"):
                 continue
             fields = ln.split('-')
             display = fields[0].strip()
@@ -1267,28 +1801,53 @@ class LickVncLauncher(object):
         Closes ssh session on port p.
 
         '''
-        if p in self.ports_in_use.keys():
+        if p in self.ports_in_use:
             try:
-                remote_connection, desktop, process = self.ports_in_use.pop(p, None)
+                remote_connection, desktop, process, cancel = self.ports_in_use.pop(p, None)
             except KeyError:
                 return
+            if self.port_by_session.get(desktop) == p:
+                del self.port_by_session[desktop]
 
             self.log.info(f" Closing SSH tunnel for port {p:d}, {desktop:s} "
                      f"on {remote_connection:s}")
-            process.kill()
+            if process is not None:
+                process.kill()
+            else:
+                self.ssh_control(cancel)
 
 
     def close_ssh_threads(self):
         '''
         close_ssh_threads(self)
 
-        Loops over open ports and closes them as needed.
-        Uses close_ssh_thread()
+        Pops every open port and closes the tunnels in parallel.
 
         '''
 
-        for p in list(self.ports_in_use.keys()):
-            self.close_ssh_thread(p)
+        processes = []
+        cancels = []
+        with self.ports_lock:
+            while self.ports_in_use:
+                p, (remote_connection, desktop, process, cancel) = self.ports_in_use.popitem()
+                self.log.info(f" Closing SSH tunnel for port {p:d}, {desktop:s} "
+                              f"on {remote_connection:s}")
+                if process is not None:
+                    processes.append(process)
+                else:
+                    cancels.append(cancel)
+            self.port_by_session.clear()
+
+        if len(processes) + len(cancels) == 0:
+            return
+
+        # close them all at once
+        workers = len(processes) + len(cancels)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for process in processes:
+                executor.submit(process.kill)
+            for cancel in cancels:
+                executor.submit(self.ssh_control, cancel)
 
 
     ##-------------------------------------------------------------------------
@@ -1306,7 +1865,8 @@ class LickVncLauncher(object):
         self.geometry = list()
         try:
             xpdyinfo = subprocess.run('xdpyinfo', stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE, timeout=5)
+                                       stderr=subprocess.PIPE, text=True,
+                                       timeout=5)
 
         except subprocess.TimeoutExpired as e:
             # If xpdyinfo fails just log and keep going
@@ -1324,20 +1884,17 @@ class LickVncLauncher(object):
             return
 
 
-        stdout = xpdyinfo.stdout.decode()
+        stdout = xpdyinfo.stdout
         if xpdyinfo.returncode != 0:
              self.log.debug(f'xpdyinfo failed')
-             for line in stdout.split('\n'):
-                 self.log.debug(f"xdpyinfo: {line}")
-             stderr = xpdyinfo.stderr.decode()
-             for line in stderr.split('\n'):
+             for line in stdout.splitlines() + xpdyinfo.stderr.splitlines():
                  self.log.debug(f"xdpyinfo: {line}")
              return None
-        find_nscreens = re.search('number of screens:\s+(\d+)', stdout)
+        find_nscreens = NSCREENS_RE.search(stdout)
         nscreens = int(find_nscreens.group(1)) if find_nscreens is not None else 1
         self.log.debug(f'Number of screens = {nscreens}')
 
-        find_dimensions = re.findall('dimensions:\s+(\d+)x(\d+)', stdout)
+        find_dimensions = DIMENSIONS_RE.findall(stdout)
         if len(find_dimensions) == 0:
             self.log.debug(f'Could not find screen dimensions')
             return None
@@ -1355,6 +1912,7 @@ class LickVncLauncher(object):
             self.geometry = window_positions
         else:
             self.log.debug(f"Calculating VNC window geometry...")
+            self.geometry = list()
             num_win = len(self.sessions_found)
             cols = 2
             rows = 2
@@ -1371,61 +1929,6 @@ class LickVncLauncher(object):
                     self.geometry.append([x, y])
         self.log.debug('geometry: ' + str(self.geometry))
 
-    def position_vnc_windows(self):
-        '''Reposition the VNC windows to the preferred positions
-        '''
-        self.log.info("Re-reading config file")
-        self.get_config()
-        self.log.info(f"Positioning VNC windows...")
-        self.calc_window_geometry()
-
-        #get all x-window processes
-        #NOTE: using wmctrl (does not work for Mac)
-        #alternate option: xdotool?
-        cmd = ['wmctrl', '-l']
-        wmctrl_l = subprocess.run(cmd, stdout=subprocess.PIPE, timeout=5)
-        stdout = wmctrl_l.stdout.decode()
-        for line in stdout.split('\n'):
-            self.log.debug(f'wmctrl line: {line}')
-        if wmctrl_l.returncode != 0:
-            self.log.debug(f'wmctrl failed')
-            for line in stdout.split('\n'):
-                self.log.debug(f'wmctrl line: {line}')
-            stderr = wmctrl_l.stderr.decode()
-            for line in stderr.split('\n'):
-                self.log.debug(f'wmctrl line: {line}')
-            return None
-        win_ids = dict([x for x in zip(self.sessions_found,
-                                [None for entry in self.sessions_found])])
-        for line in stdout.split('\n'):
-            for thread in self.vnc_threads:
-                session = thread.name
-                if session in line:
-                    self.log.debug(f"Found {session} in {line}")
-                    win_id = line.split()[0]
-                    win_ids[session] = line.split()[0]
-
-        for i,thread in enumerate(self.vnc_threads):
-            session = thread.name
-            if win_ids.get(session, None) is not None:
-                index = i % len(self.geometry)
-                geom = self.geometry[index]
-                self.log.debug(f'{session} has geometry: {geom}')
-
-                cmd = ['wmctrl', '-i', '-r', win_ids[session], '-e',
-                       f'0,{geom[0]},{geom[1]},-1,-1']
-                self.log.debug(f"Positioning '{session}' with command: " + ' '.join(cmd))
-                wmctrl = subprocess.run(cmd, stdout=subprocess.PIPE, timeout=5)
-                if wmctrl.returncode != 0:
-                    return None
-                stdout = wmctrl.stdout.decode()
-#                 for line in stdout.split('\n'):
-#                     self.log.debug(f'wmctrl line: {line}')
-            else:
-                self.log.info(f"Could not find window process for VNC session '{session}'")
-
-
-
     ##-------------------------------------------------------------------------
     ## Position vncviewers
     ##-------------------------------------------------------------------------
@@ -1437,43 +1940,44 @@ class LickVncLauncher(object):
 
 
         '''
+        self.log.info("Re-reading config file")
+        self.get_config()
         self.log.info(f"Positioning VNC windows...")
+        self.calc_window_geometry()
 
         try:
             #get all x-window processes
             #NOTE: using wmctrl (does not work for Mac)
             #alternate option: xdotool?
-            xlines = []
             cmd = ['wmctrl', '-l']
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-            while True:
-                line = proc.stdout.readline()
-                if not line: break
-                line = line.rstrip().decode('utf-8')
+            wmctrl_l = subprocess.run(cmd, capture_output=True, text=True,
+                                      timeout=5)
+            xlines = wmctrl_l.stdout.splitlines()
+            for line in xlines:
                 self.log.debug(f'wmctrl line: {line}')
-                xlines.append(line)
 
-            #reposition each vnc session window
-            for i, session in enumerate(self.sessions_found):
-                self.log.debug(f'Search xlines for "{session}"')
-                win_id = None
-                for line in xlines:
-                    if session not in line: continue
-                    parts = line.split()
-                    win_id = parts[0]
+            #map each desktop to the first window whose title names it
+            parsed = [(ln.split()[0], ln) for ln in xlines if ln]
+            win_map = {}
+            for win_id, line in parsed:
+                for s in self.sessions_found:
+                    if s.desktop in line:
+                        win_map.setdefault(s.desktop, win_id)
 
+            #reposition each vnc session window
+            for i, s in enumerate(self.sessions_found):
+                session = s.desktop
+                win_id = win_map.get(session)
                 if win_id:
                     index = i % len(self.geometry)
                     geom = self.geometry[index]
-                    ww = geom[0]
-                    wh = geom[1]
-                    wx = geom[2]
-                    wy = geom[3]
-                    # cmd = ['wmctrl', '-i', '-r', win_id, '-e', f'0,{wx},{wy},{ww},{wh}']
+                    self.log.debug(f'{session} has geometry: {geom}')
+                    wx = geom[0]
+                    wy = geom[1]
                     cmd = ['wmctrl', '-i', '-r', win_id, '-e',
                            f'0,{wx},{wy},-1,-1']
                     self.log.debug(f"Positioning '{session}' with command: " + ' '.join(cmd))
-                    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+                    subprocess.run(cmd, stdout=self.devnull, timeout=5)
                 else:
                     self.log.info(f"Could not find window process for VNC session '{session}'")
         except Exception as error:
@@ -1515,54 +2019,45 @@ class LickVncLauncher(object):
             menu += '|' + newline + ' '*(line_length-len(newline)-1) + '|\n'
         menu += "> "
 
+        # commands without arguments
+        actions = {'w' : self.position_vnc_windows,
+                   'p' : self.play_test_sound,
+                   's' : self.start_soundplay,
+                   'u' : self.upload_log,
+                   'l' : self.print_sessions_found,
+                   't' : self.list_tunnels,
+                   'v' : self.check_version}
+
         quit = None
         while quit is None:
             cmd = input(menu).lower()
-            cmatch = re.match(r'c (\d+)', cmd)
-            nmatch = re.match(r'(\d)', cmd)
             if cmd == '':
-                pass
-            elif cmd == 'q':
-                self.log.debug(f'Recieved command "{cmd}"')
+                continue
+            self.log.debug(f'Recieved command "{cmd}"')
+            action = actions.get(cmd)
+            if cmd == 'q':
                 quit = True
-            elif cmd == 'w':
-                self.log.debug(f'Recieved command "{cmd}"')
+                continue
+            if action is not None:
                 try:
-                    self.position_vnc_windows()
-                except:
-                    self.log.error("Failed to reposition windows, see log")
+                    action()
+                except Exception:
+                    self.log.error(f'Command "{cmd}" failed, see log')
                     trace = traceback.format_exc()
                     self.log.debug(trace)
-            elif cmd == 'p':
-                self.log.debug(f'Recieved command "{cmd}"')
-                self.play_test_sound()
-            elif cmd == 's':
-                self.log.debug(f'Recieved command "{cmd}"')
-                self.start_soundplay()
-            elif cmd == 'u':
-                self.log.debug(f'Recieved command "{cmd}"')
-                self.upload_log()
-            elif cmd == 'l':
-                self.log.debug(f'Recieved command "{cmd}"')
-                self.print_sessions_found()
-            elif cmd == 't':
-                self.log.debug(f'Recieved command "{cmd}"')
-                self.list_tunnels()
-            elif cmd == 'v':
-                self.log.debug(f'Recieved command "{cmd}"')
-                self.check_version()
-            elif cmatch is not None:
-                self.log.debug(f'Recieved command "{cmd}"')
+                continue
+
+            cmatch = CLOSE_CMD_RE.match(cmd)
+            nmatch = DESKTOP_CMD_RE.match(cmd)
+            if cmatch is not None:
                 self.close_ssh_thread(int(cmatch.group(1)))
             elif nmatch is not None:
-                self.log.debug(f'Recieved command "{cmd}"')
                 desktop = int(nmatch.group(1)) - 1
-                if desktop >= 0 and desktop < 6:
+                if desktop >= 0 and desktop < len(self.sessions_found):
                     self.start_vnc_session(self.sessions_found[desktop].display)
                 else:
                     self.log.error(f'Unrecognized desktop: "{cmd}"')
             else:
-                self.log.debug(f'Recieved command "{cmd}"')
                 self.log.error(f'Unrecognized command: "{cmd}"')
 
 
@@ -1582,14 +2077,27 @@ class LickVncLauncher(object):
         try:
             import requests
             from packaging import version
-            r = requests.get(url)
-            findversion = re.search(r"__version__ = '(\d.+)'", r.text)
-            if findversion is not None:
-                remote_version = version.parse(findversion.group(1))
-                local_version = version.parse(__version__)
+            # only download the file again if it changed since last time,
+            # and then only its head, __version__ is near the top
+            cache = read_cache('version_etag.json')
+            headers = {'Range': 'bytes=0-4095'}
+            if cache.get('etag') and cache.get('version'):
+                headers['If-None-Match'] = cache['etag']
+            r = requests.get(url, headers=headers, timeout=5)
+            if r.status_code == 304:
+                remote_string = cache['version']
             else:
-                self.log.warning(f'Unable to determine software version on GitHub')
-                return
+                findversion = VERSION_RE.search(r.text)
+                if findversion is None:
+                    self.log.warning(f'Unable to determine software version on GitHub')
+                    return
+                remote_string = findversion.group(1)
+                etag = r.headers.get('ETag')
+                if etag:
+                    write_cache('version_etag.json',
+                                {'etag': etag, 'version': remote_string})
+            remote_version = version.parse(remote_string)
+            local_version = version.parse(__version__)
             if remote_version == local_version:
                 self.log.info(f'Your software is up to date (v{__version__})')
             else:
@@ -1602,19 +2110,21 @@ class LickVncLauncher(object):
     ##-------------------------------------------------------------------------
     ## Upload log file to Lick
     ##-------------------------------------------------------------------------
-    def upload_log(self):
+    def upload_log(self, use_master=True):
         '''
-        upload_log(self)
+        upload_log(self, use_master=True)
 
         If possible, copies local log file to user@vncserver
 
+        use_master - copy over the ssh control master, if there is one
         '''
 
         account = self.ssh_account
 
-        logfile_handlers = [lh for lh in self.log.handlers if
-                            isinstance(lh, logging.FileHandler)]
-        logfile = pathlib.Path(logfile_handlers.pop(0).baseFilename)
+        logfile_handler = next(lh for lh in self.log.handlers if
+                               isinstance(lh, logging.handlers.MemoryHandler))
+        logfile_handler.flush()
+        logfile = pathlib.Path(logfile_handler.target.baseFilename)
 
         source = str(logfile)
         destination = account + '@' + self.vncserver + ':' + logfile.name
@@ -1626,24 +2136,34 @@ class LickVncLauncher(object):
             command.append(self.ssh_pkey)
 
         command.append('-oStrictHostKeyChecking=no')
+        command += known_hosts_options()
         command.append('-oCompression=yes')
+
+        # reuse the control master if there is one, saving the handshake
+        control_path = None
+        if use_master:
+            control_path = self.ssh_masters.get((self.vncserver, account))
+        if control_path is not None:
+            command.append(f'-oControlPath="{control_path}"')
+            command.append('-oControlMaster=no')
+
         command.append(source)
         command.append(destination)
 
         self.log.debug('scp command: ' + ' '.join (command))
 
-        pipe = subprocess.PIPE
-        null = subprocess.DEVNULL
-
-        stdin = null
-
-        proc = subprocess.Popen(command, stdin=stdin, stdout=null, stderr=null)
-        if proc.poll() is not None:
-            raise RuntimeError('subprocess failed to execute scp')
-
+        null = self.devnull
         try:
-            stdout,stderr = proc.communicate(timeout=10)
+            proc = subprocess.run(command, stdin=null, stdout=null, stderr=null,
+                                  timeout=10, check=False)
         except subprocess.TimeoutExpired:
+            proc = None
+
+        if control_path is not None and (proc is None or proc.returncode == 255):
+            self.log.debug(f'Upload over ssh master {control_path} failed, retrying without it')
+            self.drop_ssh_master(self.vncserver, account)
+            return self.upload_log(use_master=False)
+        if proc is None:
             self.log.error('  Timeout attempting to upload log file')
             return
 
@@ -1678,7 +2198,10 @@ class LickVncLauncher(object):
                 proc = self.vnc_processes.pop()
                 self.log.debug('terminating VNC process: ' + str(proc.args))
                 if proc.poll() == None:
-                    proc.terminate()
+                    try:
+                        os.killpg(proc.pid, signal.SIGTERM)
+                    except (AttributeError, OSError):
+                        proc.terminate()
 
         except:
             self.log.error("Failed to terminate VNC sessions.  See log for details.")
@@ -1716,11 +2239,27 @@ class LickVncLauncher(object):
         #close vnc sessions
         self.kill_vnc_processes()
 
+        self.devnull.close()
+
         self.exit = True
         self.log.info("Exiting\n")
         sys.exit(1)
 
 
+    ##-------------------------------------------------------------------------
+    ## Handle hangup and terminate signals
+    ##-------------------------------------------------------------------------
+    def handle_signal(self, signum, frame):
+        '''
+        handle_signal(self, signum, frame)
+
+        Closes the viewers and tunnels when the terminal goes away or the
+        process is told to terminate.
+
+        '''
+        self.exit_app(msg=f'Received {signal.Signals(signum).name}')
+
+
     ##-------------------------------------------------------------------------
     ## Handle fatal error
     ##-------------------------------------------------------------------------
@@ -1739,13 +2278,17 @@ class LickVncLauncher(object):
 
         #Log error if we have a log object (otherwise dump error to stdout)
         #and call exit_app function
-        msg = traceback.format_exc()
-        if self.log:
-            logfile = self.log.handlers[0].baseFilename
-            print(f"* Attach log file at: {logfile}\n")
-            self.log.debug(f"\n\n!!!!! PROGRAM ERROR:\n{msg}\n")
+        if getattr(self, 'log', None):
+            logfile_handler = next((lh for lh in self.log.handlers if
+                                    isinstance(lh, logging.handlers.MemoryHandler)),
+                                   None)
+            if logfile_handler is not None:
+                logfile = logfile_handler.target.baseFilename
+                print(f"* Attach log file at: {logfile}\n")
+            # the traceback is only formatted if the record is written
+            self.log.debug("\n\n!!!!! PROGRAM ERROR: %s\n", error, exc_info=True)
         else:
-            print(msg)
+            print(traceback.format_exc())
 
         self.exit_app()
 
@@ -1761,11 +2304,23 @@ class LickVncLauncher(object):
         Currently does not test sound.
 
         '''
-        self.test_vncviewer()
-        self.test_port_lookup()
-        self.test_connection()
-        server = self.servers_to_try[self.args.account]
-        self.test_connection_to_servers(server)
+        tests = [self.test_vncviewer, self.test_port_lookup,
+                 self.test_connection]
+        jobs = self.args.jobs
+        if jobs > 1:
+            # these do not depend on each other, run them side by side
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(test) for test in tests]
+                for future in futures:
+                    future.result()
+        else:
+            for test in tests:
+                test()
+        account = self.args.account
+        servers = {self.servers_to_try[account], self.soundservers[account]}
+        # ssh refuses a key that others can read
+        self.change_mod()
+        self.test_all_servers(sorted(servers))
 
 
     ##-------------------------------------------------------------------------
@@ -1781,16 +2336,16 @@ class LickVncLauncher(object):
         vncviewer = self.vncviewer
 
         if vncviewer in [None, '', 'vncviewer']:
-            # the line below will throw an error if which fails
             self.guess_vncviewer()
-            try:
-                vncviewer = subprocess.check_output(['which', 'vncviewer']).strip()
-            except:
+            vncviewer = _locate_vncviewer('vncviewer')
+            if vncviewer is None:
                 self.log.error('Cannot find vncviewer and it is not defined in the config file.')
                 return
         if vncviewer != 'open':
-            assert os.path.exists(vncviewer)
-            self.log.info(f' Passed')
+            path = _locate_vncviewer(vncviewer)
+            assert path is not None
+            self.vncviewer = path
+            self.log.info(' Passed')
 
 
     ##-------------------------------------------------------------------------
@@ -1800,21 +2355,16 @@ class LickVncLauncher(object):
         '''
         test_port_lookup(self)
 
-        Test that an application selected for finding open ports
-        is available.
-        Then tests that application by running it.
-        Both tests must pass.
+        Tests that the local port check runs and finds the first
+        local port free.
 
         '''
 
 
         self.log.info('Testing port lookup')
 
-        one_works = self.check_cmd is not None
-        assert one_works
-        self.log.info(f' Passed')
         assert self.is_local_port_in_use(self.LOCAL_PORT_START) is False
-        self.log.info(f' Passed')
+        self.log.info(' Passed')
 
     ##-------------------------------------------------------------------------
     ## test connection
@@ -1830,7 +2380,7 @@ class LickVncLauncher(object):
         self.tel = 'shane'
         self.validate_connection()
         assert self.connection_valid is True
-        self.log.info(f' Passed')
+        self.log.info(' Passed')
 
     ##-------------------------------------------------------------------------
     ## test to see if you can connect to the servers
@@ -1847,24 +2397,78 @@ class LickVncLauncher(object):
         vnc_account = self.ssh_account
         vnc_password = None
         result = f'{server}'
-        self.log.info(f'Testing SSH to {vnc_account}@{server}')
+        self.log.info('Testing SSH to %s@%s', vnc_account, server)
+        # fail in a second on an unreachable host rather than after
+        # ssh's connect timeout
+        reachable = self.tcp_reachable(server)
+        if not reachable:
+            self.log.error(' Cannot reach port 22 on %s', server)
+        assert reachable
         output = self.do_ssh_cmd('hostname', result,
                                 vnc_account)
         assert output is not None
         assert output != ''
         assert output.strip() in [server, result]
-        self.log.info(f' Passed')
+        self.log.info(' Passed')
+
+    ##-------------------------------------------------------------------------
+    ## check that a host accepts connections
+    ##-------------------------------------------------------------------------
+    def tcp_reachable(self, host, port=22, timeout=1.0):
+        '''
+        tcp_reachable(self, host, port=22, timeout=1.0)
+
+        host - remote host
+        port - port on host, ssh by default
+        timeout - seconds to wait for the connection
+
+        Returns True if a TCP connection to host:port can be opened.
+
+        '''
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError as e:
+            self.log.debug('Connection to %s:%s failed: %s', host, port, e)
+            return False
+
+    ##-------------------------------------------------------------------------
+    ## test all of the servers at once
+    ##-------------------------------------------------------------------------
+    def test_all_servers(self, servers):
+        '''
+        test_all_servers(self, servers)
+
+        servers - list of hosts to test
+
+        Runs test_connection_to_servers() for every host concurrently,
+        the ssh handshakes dominate and do not depend on each other.
+        Raises the first failure.
+
+        '''
+        workers = min(8, len(servers))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.test_connection_to_servers, server): server
+                       for server in servers}
+            for future in concurrent.futures.as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    self.log.error(' Failed SSH to %s', futures[future])
+                    for other in futures:
+                        other.cancel()
+                    raise error
 
 
 
 ##-------------------------------------------------------------------------
 ## Create argument parser
 ##-------------------------------------------------------------------------
-def create_parser():
+def build_parser():
     '''
-    create_parser()
+    build_parser()
 
-    Parses command line arguments.
+    Returns the parser for the command line arguments, without parsing
+    anything, so it can be reused.
     '''
 
     ## create a parser object for understanding command-line arguments
@@ -1887,12 +2491,14 @@ def create_parser():
     parser.add_argument("--test", dest="test",
         default=False, action="store_true",
         help="Run only tests")
+    parser.add_argument("--jobs", dest="jobs", type=int, default=1,
+        help="Number of tests to run at once with --test, defaults to 1")
     parser.add_argument("--tags", dest="tags",
         default=":1,:2,:3,:4,:5,:6",
         help='Soundplay tags, defaults to ":1,:2,:3,:4,:5,:6"')
 
     parser.add_argument("--check", dest="check",default=None,
-        help="How to check for open ports.")
+        help="Deprecated and ignored, ports are checked with a socket.")
     parser.add_argument("--novpn", dest="vpn",default=False,
                             action="store_true",help="Turn off VPN check to allow the software to run without a VPN.")
 
@@ -1908,8 +2514,18 @@ def create_parser():
     parser.add_argument("-c", "--config", dest="config", type=str,
         help="Path to local configuration file.")
 
-    #parse
-    return parser.parse_args()
+    return parser
+
+
+def create_parser(argv=None):
+    '''
+    create_parser(argv=None)
+
+    argv - list of arguments to parse, defaults to sys.argv[1:]
+
+    Parses command line arguments.
+    '''
+    return build_parser().parse_args(argv)
 
 
 if __name__ == '__main__':
@@ -86,10 +86,7 @@ class soundplay(object):
                         'nickel' : 'noir',
                         'apf' : 'frankfurt.apf'}
 
-        if instrument in soundservers.keys():
-            return soundservers[instrument]
-        else:
-            return None
+        return soundservers.get(instrument)
 
     def terminate(self):
         if self.proc: